@@ -1,27 +1,69 @@
 import streamlit as st
 import pandas as pd
 import io
-import base64
 import zipfile
 from typing import List, Dict, Tuple, Optional
 import os
-from PIL import Image
+import tempfile
 
 # Import utility modules
 from utils.file_handler import (
     read_file, 
+    get_sheet_names,
     detect_url_columns, 
     validate_filename_parts,
     prepare_dataframe
 )
 from utils.qr_generator import (
     create_qr_code,
-    generate_qr_codes,
+    iter_qr_codes,
     create_zip_file,
-    get_image_download_link
+    create_thumbnail,
+    PNG_COMPRESS_LEVEL,
+    OXIPNG_AVAILABLE
 )
 from utils.logging_utils import logger, log_dataframe_info, log_qr_generation_summary, set_debug_mode
 
+# Number of generated QR codes kept in the session for the preview grid
+PREVIEW_COUNT = 9
+PREVIEW_WIDTH = 150
+
+# URL columns are detected from this many leading rows; URL-ness is a column property
+URL_DETECTION_ROWS = 500
+
+# PNG payloads are already compressed, so store them in the ZIP without recompressing
+ZIP_COMPRESSION = zipfile.ZIP_STORED
+
+# Generated ZIPs larger than this are spooled from memory to an unnamed temporary file
+ZIP_SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+
+# Cached wrappers so Streamlit reruns don't redo expensive parsing and scanning
+@st.cache_data(show_spinner=False)
+def list_sheets(file_bytes: bytes, file_name: str) -> List[str]:
+    """List an uploaded spreadsheet's sheets without parsing them, cached on the file contents."""
+    return get_sheet_names(file_name, file_bytes)
+
+
+@st.cache_data(show_spinner=False)
+def load_sheet(file_bytes: bytes, file_name: str, sheet_name: str) -> pd.DataFrame:
+    """Parse a single sheet of an uploaded spreadsheet, cached on the file contents."""
+    return read_file(file_name, file_bytes, sheet_name).get(sheet_name, pd.DataFrame())
+
+
+@st.cache_data(show_spinner=False)
+def find_url_columns(df: pd.DataFrame) -> List[str]:
+    """Detect URL columns, cached on the dataframe contents."""
+    return detect_url_columns(df)
+
+
+def discard_zip_file() -> None:
+    """Close the session's generated ZIP file, if there is one, freeing its memory or disk space."""
+    if st.session_state.zip_file is not None:
+        st.session_state.zip_file.close()
+    st.session_state.zip_file = None
+
+
 # Initialize session state variables if they don't exist
 if 'debug_mode' not in st.session_state:
     st.session_state.debug_mode = False
@@ -61,12 +103,6 @@ st.markdown("""
     .stProgress > div > div > div > div {
         background-color: #4CAF50;
     }
-    .download-link {
-        padding: 0.5rem;
-        margin: 0.5rem 0;
-        border-radius: 5px;
-        background-color: #f5f5f5;
-    }
     h1, h2, h3 {
         color: #2C3E50;
     }
@@ -89,15 +125,27 @@ st.markdown("""
 if 'uploaded_file' not in st.session_state:
     st.session_state.uploaded_file = None
 if 'sheets_data' not in st.session_state:
-    st.session_state.sheets_data = {}
+    st.session_state.sheets_data = {}  # Only the selected sheet; others are reloaded from the parse cache
+if 'sheet_names' not in st.session_state:
+    st.session_state.sheet_names = []
 if 'selected_sheet' not in st.session_state:
     st.session_state.selected_sheet = None
 if 'url_columns' not in st.session_state:
     st.session_state.url_columns = []
+if 'url_columns_by_sheet' not in st.session_state:
+    st.session_state.url_columns_by_sheet = {}
 if 'current_df' not in st.session_state:
     st.session_state.current_df = None
 if 'qr_codes' not in st.session_state:
-    st.session_state.qr_codes = []
+    st.session_state.qr_codes = []  # Preview (filename, thumbnail_bytes, png_bytes) tuples; other PNGs live only in the ZIP
+if 'qr_count' not in st.session_state:
+    st.session_state.qr_count = 0
+if 'zip_file' not in st.session_state:
+    # Generated ZIP, spooled to an unnamed temporary file once it outgrows ZIP_SPOOL_MAX_SIZE; the
+    # session owns it, so it's freed with the session even if discard_zip_file() never runs
+    st.session_state.zip_file = None
+if 'zip_file_count' not in st.session_state:
+    st.session_state.zip_file_count = 0
 if 'progress' not in st.session_state:
     st.session_state.progress = 0
 if 'qr_size' not in st.session_state:
@@ -106,6 +154,12 @@ if 'qr_border' not in st.session_state:
     st.session_state.qr_border = 4
 if 'output_resolution' not in st.session_state:
     st.session_state.output_resolution = ""
+if 'fast_mask' not in st.session_state:
+    st.session_state.fast_mask = False
+if 'optimize_png' not in st.session_state:
+    st.session_state.optimize_png = False
+if 'max_workers' not in st.session_state:
+    st.session_state.max_workers = os.cpu_count() or 1
 
 # Title and introduction
 st.title("QR Code Generator")
@@ -144,7 +198,7 @@ with st.container(border=True):
         # Generate QR code
         qr_img = create_qr_code(quick_url, size=qr_size_quick, border=qr_border_quick, output_size=output_size_quick)
         qr_img_bytes = io.BytesIO()
-        qr_img.save(qr_img_bytes, format='PNG')
+        qr_img.save(qr_img_bytes, format='PNG', compress_level=PNG_COMPRESS_LEVEL, optimize=False)
         qr_img_bytes = qr_img_bytes.getvalue()
         
         # Display QR code
@@ -164,8 +218,6 @@ with st.container(border=True):
                 file_name=filename,
                 mime="image/png",
             )
-            # HTML link (for more compatibility)
-            st.markdown(get_image_download_link(qr_img_bytes, filename), unsafe_allow_html=True)
 
 st.divider()  # Divider between quick generator and batch processing
 
@@ -190,18 +242,22 @@ with st.sidebar:
                          uploaded_file.name != st.session_state.uploaded_file.name):
         try:
             st.session_state.uploaded_file = uploaded_file
-            st.session_state.sheets_data = read_file(uploaded_file)
+            # Only list the sheets here; a sheet's data is parsed once it's selected
+            st.session_state.sheets_data = {}
+            st.session_state.sheet_names = list_sheets(uploaded_file.getvalue(), uploaded_file.name)
             st.session_state.selected_sheet = None
             st.session_state.url_columns = []
+            st.session_state.url_columns_by_sheet = {}
             st.session_state.current_df = None
             st.session_state.qr_codes = []
+            discard_zip_file()
             st.success(f"File '{uploaded_file.name}' loaded successfully!")
         except Exception as e:
             st.error(f"Error loading file: {str(e)}")
     
     # Sheet selection (for Excel files)
-    if st.session_state.sheets_data:
-        sheet_names = list(st.session_state.sheets_data.keys())
+    if st.session_state.sheet_names:
+        sheet_names = st.session_state.sheet_names
         
         if len(sheet_names) > 1:  # Only show if multiple sheets exist
             selected_sheet = st.selectbox(
@@ -215,30 +271,76 @@ with st.sidebar:
         # Update current dataframe when sheet changes
         if selected_sheet != st.session_state.selected_sheet:
             st.session_state.selected_sheet = selected_sheet
-            st.session_state.current_df = st.session_state.sheets_data[selected_sheet]
-            st.session_state.url_columns = detect_url_columns(st.session_state.current_df)
+            # Parse only the selected sheet, and keep only it in the session to bound per-session memory
+            sheet_df = load_sheet(
+                st.session_state.uploaded_file.getvalue(), st.session_state.uploaded_file.name, selected_sheet
+            )
+            st.session_state.sheets_data = {selected_sheet: sheet_df}
+            if sheet_df.empty:
+                st.session_state.current_df = None
+                st.session_state.url_columns = []
+            else:
+                st.session_state.current_df = sheet_df
+                # Detect URL columns once per sheet; switching back to a sheet reuses the result
+                if selected_sheet not in st.session_state.url_columns_by_sheet:
+                    st.session_state.url_columns_by_sheet[selected_sheet] = find_url_columns(st.session_state.current_df.head(URL_DETECTION_ROWS))
+                st.session_state.url_columns = st.session_state.url_columns_by_sheet[selected_sheet]
             st.session_state.qr_codes = []
+            discard_zip_file()
+        
+        if st.session_state.current_df is None:
+            st.warning(f"Sheet '{selected_sheet}' is empty")
     
     # QR code options
     if st.session_state.current_df is not None:
         st.write("---")
         st.header("QR Code Options")
         
-        # Update session state with the slider values
-        st.session_state.qr_size = st.slider("Module Size", 
-                           min_value=1, max_value=20, value=st.session_state.qr_size, 
-                           help="Size of each individual QR code module/square in pixels")
-        
-        st.session_state.qr_border = st.slider("Border Width", 
-                             min_value=0, max_value=10, value=st.session_state.qr_border,
-                             help="Width of the QR code border in modules")
-        
-        st.session_state.output_resolution = st.text_input(
-            "Output Resolution (pixels)", 
-            value=st.session_state.output_resolution, 
-            placeholder="e.g., 250 for 250x250 pixels",
-            help="Final output image size in pixels (width & height). Controls the overall size of the QR code image regardless of module size."
-        )
+        # Batch the option widgets in a form so tuning them doesn't rerun the app on every change
+        with st.form("qr_options"):
+            qr_size = st.slider("Module Size", 
+                               min_value=1, max_value=20, value=st.session_state.qr_size, 
+                               help="Size of each individual QR code module/square in pixels")
+            
+            qr_border = st.slider("Border Width", 
+                                 min_value=0, max_value=10, value=st.session_state.qr_border,
+                                 help="Width of the QR code border in modules")
+            
+            fast_mask = st.checkbox(
+                "Fast QR mode (skip best mask search)",
+                value=st.session_state.fast_mask,
+                help="About 2x faster generation. Uses a fixed mask pattern, which may produce slightly less scannable codes in edge cases."
+            )
+            
+            optimize_png = st.checkbox(
+                "Optimize PNG size (oxipng)",
+                value=st.session_state.optimize_png,
+                disabled=not OXIPNG_AVAILABLE,
+                help="Losslessly shrinks each PNG, typically making the ZIP smaller at the cost of slower generation. Requires the optional pyoxipng package."
+            )
+            
+            output_resolution = st.text_input(
+                "Output Resolution (pixels)", 
+                value=st.session_state.output_resolution, 
+                placeholder="e.g., 250 for 250x250 pixels",
+                help="Final output image size in pixels (width & height). Controls the overall size of the QR code image regardless of module size."
+            )
+            
+            max_workers = st.number_input(
+                "Worker Processes",
+                min_value=1, max_value=os.cpu_count() or 1,
+                value=st.session_state.max_workers,
+                help="Number of CPU cores used to generate QR codes in parallel. Set to 1 to disable parallel generation."
+            )
+            
+            # Update session state with the form values
+            if st.form_submit_button("Apply"):
+                st.session_state.qr_size = qr_size
+                st.session_state.qr_border = qr_border
+                st.session_state.fast_mask = fast_mask
+                st.session_state.optimize_png = optimize_png
+                st.session_state.output_resolution = output_resolution
+                st.session_state.max_workers = max_workers
     
     # Add debug mode section at the bottom of the sidebar
     st.write("---")
@@ -356,7 +458,6 @@ if st.session_state.current_df is not None:
                     # Generate QR codes with progress bar
                     st.write("Generating QR codes...")
                     progress_bar = st.progress(0)
-                    qr_codes = []
                     
                     # Calculate batch size for progress updates
                     total_rows = len(processed_df)
@@ -374,19 +475,46 @@ if st.session_state.current_df is not None:
                     valid_rows = len(processed_df)
                     skipped_rows = total_rows - valid_rows
                     
-                    # Generate QR codes
-                    qr_codes = generate_qr_codes(
+                    # Generate QR codes, streaming each PNG straight into the ZIP file
+                    qr_code_stream = iter_qr_codes(
                         processed_df, 
                         url_column, 
                         qr_size=st.session_state.qr_size, 
                         qr_border=st.session_state.qr_border,
-                        output_size=output_size
+                        output_size=output_size,
+                        max_workers=st.session_state.max_workers,
+                        fast_mask=st.session_state.fast_mask,
+                        optimize_png=st.session_state.optimize_png,
+                        progress_callback=lambda done, total: progress_bar.progress(done / total)
                     )
-                    st.session_state.qr_codes = qr_codes
+                    # Stream the archive into a spooled temporary file so the PNGs never pile up in memory
+                    discard_zip_file()
+                    zip_file = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE, prefix="qr_codes_", suffix=".zip")
+                    try:
+                        zip_result = create_zip_file(
+                            qr_code_stream,
+                            preview_count=PREVIEW_COUNT,
+                            compression=ZIP_COMPRESSION,
+                            output=zip_file
+                        )
+                    except BaseException:
+                        zip_file.close()
+                        raise
+                    
+                    # Keep only the ZIP file and a few previews in the session, not every PNG
+                    st.session_state.zip_file = zip_file
+                    st.session_state.qr_count = zip_result['qr_count']
+                    st.session_state.zip_file_count = zip_result['file_count']
+                    if zip_result['file_count'] != zip_result['qr_count']:
+                        logger.warning(f"ZIP contains {zip_result['file_count']} files but generated {zip_result['qr_count']} QR codes")
+                    st.session_state.qr_codes = [
+                        (filename, create_thumbnail(img_bytes, PREVIEW_WIDTH), img_bytes)
+                        for filename, img_bytes in zip_result['previews']
+                    ]
                     progress_bar.progress(100)
                     
                     # Success message with info about skipped rows
-                    st.success(f"Generated {len(qr_codes)} QR codes successfully!")
+                    st.success(f"Generated {st.session_state.qr_count} QR codes successfully!")
                     
                     # Show info about skipped rows if any
                     if skipped_rows > 0:
@@ -397,38 +525,21 @@ if st.session_state.current_df is not None:
         st.write("---")
         st.subheader("Generated QR Codes")
         
-        # Create download button for zip file
-        zip_data = create_zip_file(st.session_state.qr_codes)
-        
-        # Count actual files in the ZIP
-        actual_files = 0
-        try:
-            zip_buffer = io.BytesIO(zip_data)
-            with zipfile.ZipFile(zip_buffer, 'r') as zip_ref:
-                # List all files in the ZIP
-                file_list = zip_ref.namelist()
-                actual_files = len(file_list)
-                logger.info(f"Files in ZIP archive: {actual_files}")
-                
-                # Log the first few filenames
-                if file_list:
-                    logger.info(f"First 5 files in ZIP: {file_list[:5]}")
-                
-                # Check for potential issues
-                if actual_files != len(st.session_state.qr_codes):
-                    logger.warning(f"ZIP contains {actual_files} files but generated {len(st.session_state.qr_codes)} QR codes")
-        except Exception as e:
-            logger.error(f"Error analyzing ZIP file: {str(e)}")
+        # File count is recorded when the ZIP is built, so reruns don't re-read the archive
+        actual_files = st.session_state.zip_file_count
         
         # Show detailed info to user
-        st.info(f"QR Codes Generated: {len(st.session_state.qr_codes)} | Files in ZIP: {actual_files}")
-        if actual_files < len(st.session_state.qr_codes):
-            st.warning(f"Note: {len(st.session_state.qr_codes) - actual_files} QR codes were skipped or merged due to duplicate or invalid filenames.")
+        st.info(f"QR Codes Generated: {st.session_state.qr_count} | Files in ZIP: {actual_files}")
+        if actual_files < st.session_state.qr_count:
+            st.warning(f"Note: {st.session_state.qr_count - actual_files} QR codes were skipped or merged due to duplicate or invalid filenames.")
         
-        # Create a download button for the ZIP file
+        # Create a download button for the ZIP file; Streamlit copies the data into its
+        # media store on each rerun either way, so the archive is read back as bytes
+        zip_file = st.session_state.zip_file
+        zip_file.seek(0)
         st.download_button(
             label=f"Download All {actual_files} QR Codes as ZIP",
-            data=zip_data,
+            data=zip_file.read(),
             file_name="qr_codes.zip",
             mime="application/zip",
             help="Download all generated QR codes in a single ZIP file",
@@ -438,24 +549,25 @@ if st.session_state.current_df is not None:
         # Display individual QR codes with preview
         st.write("### Individual QR Codes")
         
-        # Display in a grid (3 columns)
-        cols = st.columns(3)
+        # Display all previews in a single image gallery element
+        filenames = [filename for filename, _, _ in st.session_state.qr_codes]  # Previews of the first archived QR codes
+        st.image([thumb_bytes for _, thumb_bytes, _ in st.session_state.qr_codes], caption=filenames, width=PREVIEW_WIDTH)
         
-        for i, (filename, img_bytes) in enumerate(st.session_state.qr_codes[:9]):  # Show first 9 QR codes
+        # Create download buttons for the individual QR codes from the full-size preview PNGs
+        cols = st.columns(3)
+        for i, (filename, _, img_bytes) in enumerate(st.session_state.qr_codes):
             with cols[i % 3]:
-                # Display QR code image
-                b64_img = base64.b64encode(img_bytes).decode()
-                st.image(img_bytes, caption=filename, width=150)
-                
-                # Create download link for individual QR code
-                st.markdown(
-                    f'<div class="download-link">{get_image_download_link(img_bytes, filename)}</div>',
-                    unsafe_allow_html=True
+                st.download_button(
+                    label=f"Download {filename}",
+                    data=img_bytes,
+                    file_name=filename,
+                    mime="image/png",
+                    key=f"download_qr_{i}"
                 )
         
         # Show a message if there are more QR codes
-        if len(st.session_state.qr_codes) > 9:
-            st.info(f"Showing 9 of {len(st.session_state.qr_codes)} QR codes. Download the ZIP file to get all codes.")
+        if st.session_state.qr_count > len(st.session_state.qr_codes):
+            st.info(f"Showing {len(st.session_state.qr_codes)} of {st.session_state.qr_count} QR codes. Download the ZIP file to get all codes.")
 
 else:
     # Show instructions for batch processing
@@ -0,0 +1,53 @@
+import unittest
+
+import pandas as pd
+
+from utils.file_handler import prepare_dataframe, read_file, validate_filename_parts
+
+
+def _filenames(names, url_column='url'):
+    df = pd.DataFrame({url_column: [f"https://example.com/{i}" for i in range(len(names))], 'name': names})
+    return list(prepare_dataframe(df, url_column, ['name'], '_')['generated_filename'])
+
+
+class PrepareDataframeFilenameTest(unittest.TestCase):
+    """Generated filenames must be unique, without clashing with names already in the column."""
+
+    def test_suffix_skips_existing_name(self):
+        self.assertEqual(_filenames(['a', 'a', 'a_1']), ['a.png', 'a_2.png', 'a_1.png'])
+
+    def test_identical_rows_get_distinct_names(self):
+        filenames = _filenames(['same'] * 5)
+        self.assertEqual(filenames[0], 'same.png')
+        self.assertEqual(len(set(filenames)), 5)
+
+    def test_mixed_collisions_stay_unique(self):
+        names = ['a', 'a', 'a', 'b', 'a_2', 'a_1', 'b', 'b_1']
+        filenames = _filenames(names)
+        self.assertEqual(len(set(filenames)), len(names))
+        # The first occurrence of every name keeps it unchanged
+        self.assertEqual([filenames[i] for i in (0, 3, 4, 5, 7)], ['a.png', 'b.png', 'a_2.png', 'a_1.png', 'b_1.png'])
+
+
+class ValidateFilenamePartsTest(unittest.TestCase):
+    """Validation must measure the filenames prepare_dataframe actually builds."""
+
+    def test_blank_and_nan_parts_count_as_item(self):
+        for blank in ('', '   ', None, float('nan')):
+            df = pd.DataFrame({'url': ['https://example.com/'], 'a': ['x' * 249], 'b': [blank]})
+            filename = prepare_dataframe(df, 'url', ['a', 'b'], '_')['generated_filename'].iloc[0]
+            self.assertGreater(len(filename), 255)
+            self.assertFalse(validate_filename_parts(df, ['a', 'b'], '_')[0], repr(blank))
+
+    def test_arrow_backed_nulls(self):
+        csv = b'url,a,b\nhttps://example.com/,' + b'x' * 249 + b',\n'
+        df = read_file('data.csv', csv)['Sheet1']
+        self.assertFalse(validate_filename_parts(df, ['a', 'b'], '_')[0])
+
+    def test_filename_at_limit_is_valid(self):
+        df = pd.DataFrame({'url': ['https://example.com/'], 'a': ['x' * 246], 'b': [None]})
+        self.assertEqual(validate_filename_parts(df, ['a', 'b'], '_'), (True, ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
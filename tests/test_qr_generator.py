@@ -0,0 +1,39 @@
+import itertools
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from utils.qr_generator import _render_qr_png, create_qr_code
+
+URLS = (
+    'https://example.com/',
+    'https://example.com/products/item?id=1234567890&ref=spreadsheet-batch-processing',
+)
+MODULE_SIZES = (1, 3, 10)
+BORDERS = (0, 1, 4)
+OUTPUT_SIZES = (None, 0, 37, 100, 333, 1000)
+
+
+class RenderQrPngTest(unittest.TestCase):
+    """The directly encoded PNG must decode to the same pixels as create_qr_code's PIL image."""
+
+    def test_matches_create_qr_code(self):
+        for url, size, border, output_size, fast_mask in itertools.product(
+                URLS, MODULE_SIZES, BORDERS, OUTPUT_SIZES, (False, True)):
+            params = dict(url=url, size=size, border=border, output_size=output_size, fast_mask=fast_mask)
+            filename, png = _render_qr_png((url, 'qr.png'), size, border, output_size, fast_mask)
+            self.assertEqual(filename, 'qr.png')
+            self.assertIsNotNone(png, params)
+            
+            with Image.open(BytesIO(png)) as decoded:
+                self.assertEqual(decoded.mode, '1', params)
+                actual = np.asarray(decoded.convert('L'))
+            expected = np.asarray(create_qr_code(url, size, border, output_size, fast_mask).convert('L'))
+            self.assertEqual(actual.shape, expected.shape, params)
+            self.assertTrue(np.array_equal(actual, expected), params)
+
+
+if __name__ == '__main__':
+    unittest.main()
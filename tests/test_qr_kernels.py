@@ -0,0 +1,76 @@
+import random
+import string
+import unittest
+
+import qrcode
+from qrcode.exceptions import DataOverflowError
+
+from utils.qr_kernels import best_fit_version, best_mask_pattern
+
+ERROR_CORRECTIONS = (
+    qrcode.constants.ERROR_CORRECT_L,
+    qrcode.constants.ERROR_CORRECT_M,
+    qrcode.constants.ERROR_CORRECT_Q,
+    qrcode.constants.ERROR_CORRECT_H,
+)
+
+
+def _random_data(rng: random.Random, max_length: int) -> str:
+    """Random data mixing numeric, alphanumeric and byte-mode runs, plus URL-like strings."""
+    alphabets = (string.digits, string.digits + string.ascii_uppercase + ' $%*+-./:', string.printable, 'åéîøü€')
+    parts = []
+    while sum(map(len, parts)) < max_length and (not parts or rng.random() < 0.7):
+        alphabet = rng.choice(alphabets)
+        parts.append(''.join(rng.choice(alphabet) for _ in range(rng.randint(1, max_length))))
+    data = ''.join(parts)[:max_length]
+    return f"https://example.com/{data}" if rng.random() < 0.3 else data
+
+
+def _qr_with_data(data: str, error_correction: int) -> qrcode.QRCode:
+    qr = qrcode.QRCode(error_correction=error_correction)
+    qr.add_data(data)
+    return qr
+
+
+class BestFitVersionTest(unittest.TestCase):
+    """best_fit_version must pick the same version as QRCode.best_fit."""
+
+    def test_matches_qrcode(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            data = _random_data(rng, rng.choice((20, 200, 2000)))
+            error_correction = rng.choice(ERROR_CORRECTIONS)
+            expected = _qr_with_data(data, error_correction)
+            try:
+                expected_version = expected.best_fit()
+            except (DataOverflowError, ValueError):
+                with self.assertRaises(DataOverflowError, msg=repr(data)):
+                    best_fit_version(_qr_with_data(data, error_correction))
+                continue
+            qr = _qr_with_data(data, error_correction)
+            self.assertEqual(best_fit_version(qr), expected_version, repr(data))
+            self.assertEqual(qr.version, expected_version)
+
+    def test_overflow(self):
+        qr = _qr_with_data('1' * 8000, qrcode.constants.ERROR_CORRECT_L)
+        with self.assertRaises(DataOverflowError):
+            best_fit_version(qr)
+
+
+class BestMaskPatternTest(unittest.TestCase):
+    """best_mask_pattern must pick the same mask as QRCode.best_mask_pattern."""
+
+    def test_matches_qrcode(self):
+        rng = random.Random(1)
+        for _ in range(150):
+            data = _random_data(rng, rng.choice((20, 100, 400)))
+            error_correction = rng.choice(ERROR_CORRECTIONS)
+            expected = _qr_with_data(data, error_correction)
+            expected.best_fit()
+            qr = _qr_with_data(data, error_correction)
+            best_fit_version(qr)
+            self.assertEqual(best_mask_pattern(qr), expected.best_mask_pattern(), repr(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
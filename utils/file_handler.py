@@ -1,44 +1,119 @@
+import logging
 import pandas as pd
-import re
 from io import BytesIO
 from typing import List, Dict, Tuple, Optional, Union, Set
 from utils.logging_utils import logger, log_dataframe_info
 
+# Detection only needs a coarse check, so a column counts as URLs when values start with a scheme
+URL_PREFIXES = ('http://', 'https://')
 
-def read_file(uploaded_file) -> Dict:
+# URL detection takes its sample from the first sample_rows * URL_SAMPLE_SCAN_FACTOR rows, which
+# tolerates leading blank cells without scanning whole columns for NaN
+URL_SAMPLE_SCAN_FACTOR = 20
+
+# Characters that aren't allowed in filenames, each mapped to '-' in a single translate pass
+INVALID_FILENAME_CHARS = frozenset('<>:"/\\|?*')
+_FILENAME_TRANS = str.maketrans({char: '-' for char in INVALID_FILENAME_CHARS})
+
+
+def _open_excel(file_data: bytes) -> pd.ExcelFile:
+    """
+    Open an Excel workbook without parsing any sheet data yet.
+    
+    Uses the Rust-based calamine parser when it's available (pandas >= 2.2
+    with python-calamine), falling back to the default engine.
+    
+    Args:
+        file_data: Contents of the uploaded file
+        
+    Returns:
+        pd.ExcelFile: Open workbook handle
+    """
+    try:
+        return pd.ExcelFile(BytesIO(file_data), engine='calamine')
+    except (ImportError, ValueError) as e:
+        logger.info(f"Calamine engine unavailable ({e}), using default Excel engine")
+        return pd.ExcelFile(BytesIO(file_data))
+
+
+def get_sheet_names(file_name: str, file_data: bytes) -> List[str]:
+    """
+    List the sheets of an uploaded file without parsing their contents.
+    
+    Args:
+        file_name: Name of the uploaded file, used to pick the parser
+        file_data: Contents of the uploaded file
+        
+    Returns:
+        List[str]: Sheet names in workbook order ('Sheet1' for CSV files)
+    """
+    file_extension = file_name.split('.')[-1].lower()
+    
+    if file_extension in ['xls', 'xlsx', 'xlsm']:
+        with _open_excel(file_data) as excel_file:
+            return list(excel_file.sheet_names)
+    
+    elif file_extension == 'csv':
+        return ['Sheet1']
+    
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+
+def read_file(file_name: str, file_data: bytes, sheet_name: Optional[str] = None) -> Dict:
     """
     Read an uploaded file (Excel or CSV) and return a dictionary of dataframes.
     
+    Taking the raw bytes rather than the Streamlit upload object keeps the
+    arguments hashable, so callers can cache the parse with st.cache_data.
+    
     Args:
-        uploaded_file: The uploaded file object from Streamlit
+        file_name: Name of the uploaded file, used to pick the parser
+        file_data: Contents of the uploaded file
+        sheet_name: Only parse this sheet of an Excel file (all sheets if None)
         
     Returns:
         Dict: Dictionary with sheet names as keys and dataframes as values
     """
-    file_extension = uploaded_file.name.split('.')[-1].lower()
+    file_extension = file_name.split('.')[-1].lower()
     
     if file_extension in ['xls', 'xlsx', 'xlsm']:
-        # For Excel files, read all sheets
-        excel_file = pd.ExcelFile(uploaded_file)
-        sheet_names = excel_file.sheet_names
-        sheets_data = {}
-        
-        for sheet in sheet_names:
-            df = pd.read_excel(excel_file, sheet_name=sheet)
-            if not df.empty:
-                sheets_data[sheet] = df
+        # For Excel files, parse only the requested sheet, or all sheets in a single pass
+        with _open_excel(file_data) as excel_file:
+            all_sheets = excel_file.parse(sheet_name=[sheet_name] if sheet_name is not None else None)
         
-        return sheets_data
+        return {sheet: df for sheet, df in all_sheets.items() if not df.empty}
     
     elif file_extension == 'csv':
-        # For CSV files, there's only one sheet
-        df = pd.read_csv(uploaded_file)
+        # For CSV files, there's only one sheet. Parse with the multithreaded pyarrow
+        # reader (installed with Streamlit) into Arrow-backed columns, falling back to pandas' C parser
+        try:
+            df = pd.read_csv(BytesIO(file_data), engine='pyarrow', dtype_backend='pyarrow')
+        except (ImportError, ValueError) as e:
+            logger.info(f"pyarrow CSV engine unavailable ({e}), using default CSV engine")
+            df = pd.read_csv(BytesIO(file_data))
         return {'Sheet1': df}
     
     else:
         raise ValueError(f"Unsupported file type: {file_extension}")
 
 
+def _safe_str_series(series: pd.Series) -> pd.Series:
+    """
+    Convert a column to the strings used in filenames.
+    
+    For filename generation ONLY; this should NOT be used for the URL column itself.
+    
+    Args:
+        series: Column supplying one part of each filename
+        
+    Returns:
+        pd.Series: String values, with "item" as a generic placeholder for NaN and blank values
+    """
+    values = series.astype(str)
+    return values.mask(series.isna() | (values.str.strip() == ''), "item")
+
+
 def detect_url_columns(df: pd.DataFrame, sample_rows: int = 5) -> List[str]:
     """
     Detect columns that likely contain URLs.
@@ -51,28 +126,25 @@ def detect_url_columns(df: pd.DataFrame, sample_rows: int = 5) -> List[str]:
         List[str]: List of column names that contain URLs
     """
     url_columns = []
-    url_pattern = re.compile(
-        r'^(?:http|https)://'  # http:// or https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain
-        r'localhost|'  # localhost
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # or IP
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
     
     # Check each column
     for col in df.columns:
-        # Get the first few rows of non-null values
-        sample_values = df[col].dropna().head(sample_rows).astype(str)
+        # Numeric, boolean and datetime columns can't hold URL strings
+        if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+            continue
+        
+        # Get the first few non-null values from a bounded prefix of the column
+        sample_values = df[col].head(sample_rows * URL_SAMPLE_SCAN_FACTOR).dropna().head(sample_rows).astype(str)
         
-        # Skip if sample is empty
-        if len(sample_values) == 0:
+        # Skip if sample is empty, or too short to be URLs (e.g. "http://a.b" is 10 characters)
+        if len(sample_values) == 0 or sample_values.str.len().lt(10).all():
             continue
         
-        # Check if most values match URL pattern
-        url_count = sum(1 for value in sample_values if url_pattern.match(value))
+        # Check if most values look like URLs with a vectorized prefix test (no regex backtracking)
+        url_ratio = sample_values.str.lower().str.startswith(URL_PREFIXES).mean()
         
         # If at least 60% of the values appear to be URLs, consider it a URL column
-        if url_count / len(sample_values) >= 0.6:
+        if url_ratio >= 0.6:
             url_columns.append(col)
     
     return url_columns
@@ -91,26 +163,25 @@ def validate_filename_parts(df: pd.DataFrame, selected_columns: List[str], separ
         Tuple[bool, str]: (is_valid, error_message)
     """
     # Check if separator is valid for filenames
-    invalid_chars = r'<>:"/\|?*'
-    if separator in invalid_chars:
+    if not INVALID_FILENAME_CHARS.isdisjoint(separator):
         return False, f"Separator contains invalid filename character: '{separator}'"
     
-    # Sample a few rows to check filename validity
-    sample_size = min(5, len(df))
-    
-    for i in range(sample_size):
-        filename_parts = []
-        for col in selected_columns:
-            if col in df.columns:
-                value = str(df.iloc[i][col])
-                # Replace invalid filename characters
-                for char in invalid_chars:
-                    value = value.replace(char, '-')
-                filename_parts.append(value)
-        
-        test_filename = separator.join(filename_parts) + '.png'
-        if len(test_filename) > 255:
-            return False, f"Generated filename exceeds 255 characters: '{test_filename[:50]}...'"
+    columns = [col for col in selected_columns if col in df.columns]
+    if not columns or df.empty:
+        return True, ""
+    
+    # Check every row by summing the part lengths rather than building the filenames; parts are
+    # converted the same way prepare_dataframe does (blank and NaN cells become "item"), and
+    # sanitizing replaces characters one-for-one, so it doesn't change the length
+    part_values = [_safe_str_series(df[col]) for col in columns]
+    part_lengths = [values.str.len() for values in part_values]
+    filename_lengths = sum(part_lengths) + len(separator) * (len(columns) - 1) + len('.png')
+    
+    longest_row = int(filename_lengths.to_numpy().argmax())
+    if filename_lengths.iloc[longest_row] > 255:
+        # Only the offending row's filename is built, for the error message
+        filename = separator.join(values.iloc[longest_row] for values in part_values).translate(_FILENAME_TRANS)
+        return False, f"Generated filename exceeds 255 characters: '{filename[:50]}...'"
     
     return True, ""
 
@@ -129,82 +200,63 @@ def prepare_dataframe(df: pd.DataFrame, url_column: str, filename_columns: List[
     Returns:
         pd.DataFrame: Processed dataframe with filename column and filtered rows
     """
-    # Make a copy to avoid modifying the original
-    processed_df = df.copy()
-    
-    # Log input dataframe info
-    log_dataframe_info(processed_df, "Original dataframe")
+    # Log input dataframe info; the source dataframe is only read, never copied
+    log_dataframe_info(df, "Original dataframe")
     logger.info(f"URL column: {url_column}, Filename columns: {filename_columns}, Separator: '{separator}'")
     
-    # Log the raw data from the spreadsheet
-    logger.info("Raw data from spreadsheet (first 10 rows):")
-    for idx, row in processed_df.head(10).iterrows():
-        logger.info(f"Row {idx}:")
-        for col_name, value in row.items():
-            logger.info(f"  - {col_name}: {value} (type: {type(value).__name__}, isna: {pd.isna(value)})")
-    
-    # Log specific info about URL column before filtering
-    logger.info(f"URL column '{url_column}' data before filtering:")
-    for idx, value in processed_df[url_column].head(20).items():
-        logger.info(f"  Row {idx}: {value} (type: {type(value).__name__}, isna: {pd.isna(value)}, strip empty: {str(value).strip() == '' if not pd.isna(value) else 'N/A'})")
+    # Per-row diagnostics are only built when INFO logging is on (debug mode)
+    if logger.isEnabledFor(logging.INFO):
+        # Log the raw data from the spreadsheet
+        logger.info("Raw data from spreadsheet (first 10 rows):")
+        for idx, *values in df.head(10).itertuples(index=True, name=None):
+            logger.info(f"Row {idx}:")
+            for col_name, value in zip(df.columns, values):
+                logger.info(f"  - {col_name}: {value} (type: {type(value).__name__}, isna: {pd.isna(value)})")
+        
+        # Log specific info about URL column before filtering
+        logger.info(f"URL column '{url_column}' data before filtering:")
+        for idx, value in df[url_column].head(20).items():
+            logger.info(f"  Row {idx}: {value} (type: {type(value).__name__}, isna: {pd.isna(value)}, strip empty: {str(value).strip() == '' if not pd.isna(value) else 'N/A'})")
     
-    # Filter out rows with empty or NaN URLs
-    original_count = len(processed_df)
+    # Filter out rows with empty or NaN URLs using vectorized masks
+    url_isna = df[url_column].isna()
+    url_is_empty = ~url_isna & (df[url_column].astype(str).str.strip() == '')
     
-    # Identify and log problematic rows before dropping them
-    problematic_rows = processed_df[pd.isna(processed_df[url_column])]
-    for idx, row in problematic_rows.iterrows():
+    # Identify and log problematic rows before dropping them, iterating plain tuples rather than per-row Series
+    for idx, *values in df[url_isna].itertuples(index=True, name=None):
         logger.warning(f"Row {idx} has NaN in URL column '{url_column}':")
-        for col_name, value in row.items():
+        for col_name, value in zip(df.columns, values):
             logger.warning(f"  - {col_name}: {value} (type: {type(value).__name__})")
     
-    # Actually drop the NaN values
-    processed_df = processed_df.dropna(subset=[url_column])
-    after_nan_count = len(processed_df)
-    if original_count > after_nan_count:
-        logger.info(f"Dropped {original_count - after_nan_count} rows with NaN values in URL column '{url_column}'")
-    
-    # Identify and log rows with empty strings before filtering
-    empty_url_rows = processed_df[processed_df[url_column].astype(str).str.strip() == '']
-    for idx, row in empty_url_rows.iterrows():
+    for idx, *values in df[url_is_empty].itertuples(index=True, name=None):
         logger.warning(f"Row {idx} has empty string in URL column '{url_column}':")
-        for col_name, value in row.items():
+        for col_name, value in zip(df.columns, values):
             logger.warning(f"  - {col_name}: {value} (type: {type(value).__name__})")
     
-    # Filter empty strings
-    processed_df = processed_df[processed_df[url_column].astype(str).str.strip() != '']
-    after_empty_count = len(processed_df)
-    if after_nan_count > after_empty_count:
-        logger.info(f"Dropped {after_nan_count - after_empty_count} rows with empty strings in URL column '{url_column}'")
-    
-    # Create a helper function to safely convert cell values for filename generation ONLY
-    # This should NOT be used for the URL column itself
-    def safe_str_value(value):
-        if pd.isna(value):
-            return "item"  # More generic placeholder than "missing"
-        s = str(value)
-        return s if s.strip() != '' else "item"  # Use "item" instead of "empty"
-    
-    # Create filename column with safe value conversion
-    logger.info("Creating filename column with safe value conversion")
-    processed_df['generated_filename'] = processed_df.apply(
-        lambda row: separator.join(safe_str_value(row[col]) for col in filename_columns) + '.png', 
-        axis=1
-    )
+    # Drop NaN and empty URLs in a single pass
+    valid_rows = ~(url_isna | url_is_empty)
+    nan_dropped = int(url_isna.sum())
+    empty_dropped = int(url_is_empty.sum())
+    if nan_dropped:
+        logger.info(f"Dropped {nan_dropped} rows with NaN values in URL column '{url_column}'")
+    if empty_dropped:
+        logger.info(f"Dropped {empty_dropped} rows with empty strings in URL column '{url_column}'")
     
-    # Sanitize filenames by replacing invalid characters
-    invalid_chars = r'<>:"/\|?*'
-    for char in invalid_chars:
-        processed_df['generated_filename'] = processed_df['generated_filename'].str.replace(char, '-')
+    # Nothing left to name, so skip the filename work entirely
+    if not valid_rows.any():
+        logger.warning(f"No rows with a URL in column '{url_column}'")
+        return pd.DataFrame({url_column: df[url_column].iloc[:0], 'generated_filename': pd.Series(dtype=str)})
     
-    # Replace 'nan' in filenames with 'missing'
-    processed_df['generated_filename'] = processed_df['generated_filename'].str.replace('nan', 'missing')
+    # Create filename column by joining the columns with vectorized string concatenation
+    logger.info("Creating filename column with safe value conversion")
+    filename_parts = [_safe_str_series(df.loc[valid_rows, col]) for col in filename_columns]
+    processed_df = pd.DataFrame({
+        url_column: df.loc[valid_rows, url_column],
+        'generated_filename': filename_parts[0].str.cat(filename_parts[1:], sep=separator) + '.png',
+    })
     
-    # Log filenames that still contain 'nan' after replacement
-    nan_filenames = processed_df[processed_df['generated_filename'].str.contains('nan')]
-    if not nan_filenames.empty:
-        logger.warning(f"Found {len(nan_filenames)} filenames still containing 'nan' after replacement")
-        logger.warning(f"Sample filenames: {nan_filenames['generated_filename'].head(3).tolist()}")
+    # Sanitize filenames by replacing invalid characters in a single pass
+    processed_df['generated_filename'] = processed_df['generated_filename'].str.translate(_FILENAME_TRANS)
     
     # Check for duplicate filenames
     filename_counts = processed_df['generated_filename'].value_counts()
@@ -214,17 +266,23 @@ def prepare_dataframe(df: pd.DataFrame, url_column: str, filename_columns: List[
         for filename, count in duplicates.items():
             logger.warning(f"Filename '{filename}' appears {count} times")
         
-        # Add a unique suffix to duplicate filenames
-        dup_mask = processed_df['generated_filename'].duplicated(keep=False)
-        processed_df.loc[dup_mask, 'generated_filename'] = processed_df.loc[dup_mask].apply(
-            lambda x: x['generated_filename'].replace('.png', f'_{pd.util.hash_pandas_object(x).sum()}.png'),
-            axis=1
-        )
+        # Number repeat occurrences of a filename (name_1.png, name_2.png, ...), keeping the first as is
+        # and skipping any suffix that would clash with a name already in the column
+        dup_mask = processed_df['generated_filename'].duplicated()
+        used_names = set(filename_counts.index)
+        next_suffix = {}
+        unique_names = []
+        for filename in processed_df.loc[dup_mask, 'generated_filename']:
+            base_name = filename[:-len('.png')]
+            suffix = next_suffix.get(filename, 1)
+            while f"{base_name}_{suffix}.png" in used_names:
+                suffix += 1
+            next_suffix[filename] = suffix + 1
+            unique_names.append(f"{base_name}_{suffix}.png")
+            used_names.add(unique_names[-1])
+        processed_df.loc[dup_mask, 'generated_filename'] = unique_names
         logger.info("Added unique suffixes to duplicate filenames")
     
-    # Keep only necessary columns
-    processed_df = processed_df[[url_column, 'generated_filename']]
-    
     # Log final dataframe info
     log_dataframe_info(processed_df, "Final processed dataframe")
     
@@ -1,6 +1,7 @@
 import logging
 import sys
 import pandas as pd
+from collections import Counter
 from typing import Any, Dict, List, Optional
 
 # Set up basic logger configuration
@@ -15,6 +16,9 @@ logging.basicConfig(
 # Create logger
 logger = logging.getLogger("qr_generator")
 
+# NaN counts in log_dataframe_info are taken from at most this many leading rows
+NAN_SCAN_MAX_ROWS = 100_000
+
 # Function to adjust logger level based on debug mode setting
 def set_debug_mode(enabled: bool = False):
     """
@@ -34,16 +38,27 @@ def log_dataframe_info(df: pd.DataFrame, description: str) -> None:
     """
     Log information about a dataframe.
     
+    Nothing is computed unless INFO logging is enabled, and NaN counts for
+    large frames are taken from the first NAN_SCAN_MAX_ROWS rows only.
+    
     Args:
         df: DataFrame to log information about
         description: Description of the dataframe
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     logger.info(f"{description} | Shape: {df.shape} | Columns: {list(df.columns)}")
     
-    # Log value counts for NaN values in each column
-    na_counts = df.isna().sum()
+    # Log value counts for NaN values in each column, bounding the scan on large frames
+    if len(df) > NAN_SCAN_MAX_ROWS:
+        na_counts = df.head(NAN_SCAN_MAX_ROWS).isna().sum()
+        scope = f" (sampled, first {NAN_SCAN_MAX_ROWS} rows)"
+    else:
+        na_counts = df.isna().sum()
+        scope = ""
     if na_counts.sum() > 0:
-        logger.info(f"NaN counts in {description}:")
+        logger.info(f"NaN counts in {description}{scope}:")
         for col, count in na_counts.items():
             if count > 0:
                 logger.info(f"  - {col}: {count} NaN values")
@@ -57,6 +72,9 @@ def log_row_data(row: pd.Series, row_index: int, description: str) -> None:
         row_index: Index of the row in the original dataframe
         description: Description of the logging context
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     logger.info(f"{description} | Row {row_index}:")
     for col, value in row.items():
         logger.info(f"  - {col}: {value} (type: {type(value).__name__})")
@@ -82,16 +100,8 @@ def log_qr_generation_summary(
     logger.info(f"  - QR codes successfully generated: {qr_codes_generated}")
     
     if output_filenames:
-        # Check for duplicates in filenames
-        filename_counts = {}
-        for filename in output_filenames:
-            if filename in filename_counts:
-                filename_counts[filename] += 1
-            else:
-                filename_counts[filename] = 1
-        
-        # Log duplicates if any
-        duplicates = {f: c for f, c in filename_counts.items() if c > 1}
+        # Check for duplicates in filenames, counting them in one C-level pass
+        duplicates = {f: c for f, c in Counter(output_filenames).items() if c > 1}
         if duplicates:
             logger.warning(f"Duplicate filenames detected:")
             for filename, count in duplicates.items():
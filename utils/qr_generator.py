@@ -1,53 +1,240 @@
+import numpy as np
 import qrcode
 from PIL import Image
 import pandas as pd
 import zipfile
 import io
+import logging
 import re
 import os
-from typing import Dict, List, Tuple, Union, ByteString, Optional
+import struct
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Tuple, Union, ByteString, Optional
 import base64
 from utils.logging_utils import logger, log_dataframe_info, log_row_data, log_qr_generation_summary
+from utils.qr_kernels import best_fit_version, best_mask_pattern
 
+# Optional lossless PNG optimizer (pip install pyoxipng), only used when optimize_png is requested
+try:
+    import oxipng
+except ImportError:
+    oxipng = None
 
-def create_qr_code(url: str, size: int = 10, border: int = 4, output_size: Optional[int] = None) -> Image.Image:
+OXIPNG_AVAILABLE = oxipng is not None
+
+# QR PNGs are flat 1-bit images; zlib level 1 encodes them faster than the default 6 for a few
+# hundred extra bytes each
+PNG_COMPRESS_LEVEL = 1
+
+# Filename patterns produced by rows with blank filename columns; such files are skipped
+PROBLEMATIC_FILENAME_PATTERNS = ('missing_missing', 'nan_nan', 'item_item', 'empty_empty')
+_PROBLEMATIC_FILENAME_RE = re.compile('|'.join(map(re.escape, PROBLEMATIC_FILENAME_PATTERNS)), re.IGNORECASE)
+
+# Batches smaller than this are rendered in-process; worker start-up would outweigh the gain
+PARALLEL_MIN_ROWS = 50
+
+# Rendered PNGs keyed on (url, qr_size, qr_border, output_size, fast_mask, optimize_png), shared across
+# sessions and bounded by total size as well as entry count, since output resolution is user-controlled
+QR_CACHE_MAX_ENTRIES = 10000
+QR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+QRCacheKey = Tuple[str, int, int, Optional[int], bool, bool]
+_qr_png_cache: "OrderedDict[QRCacheKey, bytes]" = OrderedDict()
+_qr_png_cache_bytes = 0
+_qr_png_cache_lock = threading.Lock()
+
+# 8-byte signature and header fields of a 1-bit grayscale PNG (bit depth 1, color type 0,
+# deflate compression, adaptive filtering, no interlace)
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_1BIT_HEADER = struct.Struct('>IIBBBBB')
+
+
+def _get_cached_qr_png(key: QRCacheKey) -> Optional[bytes]:
+    """Return the cached PNG for a (url, qr_size, qr_border, output_size, fast_mask, optimize_png) key, if any."""
+    with _qr_png_cache_lock:
+        png = _qr_png_cache.get(key)
+        if png is not None:
+            _qr_png_cache.move_to_end(key)
+        return png
+
+
+def _store_cached_qr_png(key: QRCacheKey, png: bytes) -> None:
+    """Add a PNG to the cache, evicting the least recently used entries beyond the limits."""
+    global _qr_png_cache_bytes
+    # A single PNG taking a large share of the budget would just flush everything else
+    if len(png) > QR_CACHE_MAX_BYTES // 100:
+        return
+    with _qr_png_cache_lock:
+        previous = _qr_png_cache.pop(key, None)
+        if previous is not None:
+            _qr_png_cache_bytes -= len(previous)
+        _qr_png_cache[key] = png
+        _qr_png_cache_bytes += len(png)
+        while len(_qr_png_cache) > QR_CACHE_MAX_ENTRIES or _qr_png_cache_bytes > QR_CACHE_MAX_BYTES:
+            _, evicted = _qr_png_cache.popitem(last=False)
+            _qr_png_cache_bytes -= len(evicted)
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """Frame PNG chunk data with its length and CRC."""
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _qr_module_pixels(url: str, border: int = 4, fast_mask: bool = False) -> np.ndarray:
     """
-    Create a QR code image from a URL.
+    Encode a URL and rasterize the QR symbol at one pixel per module.
     
     Args:
         url: The URL to encode in the QR code
-        size: Size of the QR code box (1-40)
         border: Border width in modules
-        output_size: Final output image size in pixels (if specified, will resize the image)
+        fast_mask: Use a fixed mask pattern instead of searching for the best one
         
     Returns:
-        PIL.Image: QR code image
+        np.ndarray: Square boolean array including the quiet-zone border, True for light pixels
     """
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=size,
         border=border,
+        mask_pattern=0 if fast_mask else None,
     )
     
     qr.add_data(url)
-    qr.make(fit=True)
+    # Size the symbol arithmetically rather than with qrcode's bit-by-bit best_fit probe
+    best_fit_version(qr)
+    if fast_mask:
+        qr.make(fit=False)
+    else:
+        # Pick the mask pattern with the vectorized penalty scorer instead of qrcode's Python loops
+        qr.makeImpl(False, best_mask_pattern(qr))
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    light_modules = ~np.asarray(qr.modules, dtype=bool)
+    modules_count = light_modules.shape[0]
+    pixels = np.ones((modules_count + 2 * border,) * 2, dtype=bool)
+    pixels[border:border + modules_count, border:border + modules_count] = light_modules
+    return pixels
+
+
+def _encode_qr_png(pixels: np.ndarray, size: int, output_size: Optional[int] = None) -> bytes:
+    """
+    Scale a one-pixel-per-module QR raster and encode it as a 1-bit grayscale PNG.
+    
+    Writes the PNG chunks directly with zlib instead of going through a PIL image
+    and its PNG plugin. Scaling is nearest-neighbour and samples the same pixels
+    as PIL's Image.NEAREST resize, so the decoded image matches create_qr_code.
     
-    # Resize image if output_size is specified
+    Args:
+        pixels: Square boolean raster from _qr_module_pixels, True for light pixels
+        size: Size of the QR code modules in pixels, used when output_size is not set
+        output_size: Final output image size in pixels (optional)
+        
+    Returns:
+        bytes: PNG file contents
+    """
+    pixel_count = pixels.shape[0]
     if output_size and output_size > 0:
-        img = img.resize((output_size, output_size), Image.LANCZOS)
+        # Nearest-neighbour: sample the source pixel under each output pixel's centre
+        samples = ((np.arange(output_size) + 0.5) * (pixel_count / output_size)).astype(np.intp)
+    else:
+        samples = np.repeat(np.arange(pixel_count), size)
+    
+    # Widen and bit-pack each source row once, then repeat the packed rows for the height
+    packed_rows = np.packbits(pixels[:, samples], axis=1)[samples]
+    width = len(samples)
+    
+    # Every scanline starts with filter type 0 (None)
+    scanlines = np.zeros((width, packed_rows.shape[1] + 1), dtype=np.uint8)
+    scanlines[:, 1:] = packed_rows
+    
+    return b''.join((
+        _PNG_SIGNATURE,
+        _png_chunk(b'IHDR', _PNG_1BIT_HEADER.pack(width, width, 1, 0, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), PNG_COMPRESS_LEVEL)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def create_qr_code(url: str, size: int = 10, border: int = 4, output_size: Optional[int] = None,
+                   fast_mask: bool = False) -> Image.Image:
+    """
+    Create a QR code image from a URL.
+    
+    Args:
+        url: The URL to encode in the QR code
+        size: Size of the QR code box (1-40)
+        border: Border width in modules
+        output_size: Final output image size in pixels (if specified, will resize the image)
+        fast_mask: Use a fixed mask pattern instead of searching for the best one (about 2x faster)
+        
+    Returns:
+        PIL.Image: QR code image
+    """
+    # Rasterize one pixel per module, then let PIL's C nearest-neighbour resize scale it
+    # to box_size, or straight to output_size, in one pass
+    pixels = _qr_module_pixels(url, border=border, fast_mask=fast_mask)
+    img = Image.fromarray(pixels)  # Boolean arrays become 1-bit black/white images
+    
+    # Nearest-neighbour keeps module edges sharp, and at whole multiples it copies each module exactly
+    target_size = output_size if output_size and output_size > 0 else img.width * size
+    if img.width != target_size:
+        img = img.resize((target_size, target_size), Image.NEAREST)
         
     return img
 
 
-def generate_qr_codes(df: pd.DataFrame, url_column: str, 
-                      filename_column: str = 'generated_filename',
-                      qr_size: int = 10, qr_border: int = 4,
-                      output_size: Optional[int] = None) -> List[Tuple[str, bytes]]:
+def _render_qr_png(item: Tuple[str, str], size: int, border: int,
+                   output_size: Optional[int], fast_mask: bool = False,
+                   optimize_png: bool = False) -> Tuple[str, Optional[bytes]]:
     """
-    Generate QR codes for all URLs in the dataframe.
+    Render a single QR code to PNG bytes.
+    
+    Defined at module level so it can be pickled and run in a worker process.
+    
+    Args:
+        item: (url, filename) tuple
+        size: Size of the QR code modules
+        border: Border width in modules
+        output_size: Final output image size in pixels (optional)
+        fast_mask: Use a fixed mask pattern instead of searching for the best one
+        optimize_png: Losslessly recompress the PNG with oxipng (must be installed)
+        
+    Returns:
+        Tuple[str, Optional[bytes]]: (filename, image_bytes), image_bytes is None if rendering failed
+    """
+    url, filename = item
+    try:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Generating QR code for URL: {url[:50]}..." if len(url) > 50 else f"Generating QR code for URL: {url}")
+        # Encode straight from the module raster; no PIL image is needed for the PNG bytes
+        pixels = _qr_module_pixels(url, border=border, fast_mask=fast_mask)
+        png = _encode_qr_png(pixels, size, output_size)
+        if optimize_png:
+            # Runs inside the worker processes, so larger batches are optimized in parallel
+            png = oxipng.optimize_from_memory(png, level=2, fast_evaluation=True, strip=oxipng.StripChunks.safe())
+        return filename, png
+    except Exception:
+        logger.error(f"Error generating QR code for '{filename}' (URL: {url}):", exc_info=True)
+        return filename, None
+
+
+def iter_qr_codes(df: pd.DataFrame, url_column: str, 
+                  filename_column: str = 'generated_filename',
+                  qr_size: int = 10, qr_border: int = 4,
+                  output_size: Optional[int] = None,
+                  max_workers: Optional[int] = None,
+                  progress_callback: Optional[Callable[[int, int], None]] = None,
+                  use_cache: bool = True,
+                  fast_mask: bool = False,
+                  optimize_png: bool = False) -> Iterator[Tuple[str, bytes]]:
+    """
+    Generate QR codes for all URLs in the dataframe, yielding each one as soon as it is ready.
+    
+    QR codes are yielded in row order so callers can stream them into a ZIP file
+    without holding every PNG in memory.
     
     Args:
         df: DataFrame containing URLs and filenames
@@ -56,12 +243,15 @@ def generate_qr_codes(df: pd.DataFrame, url_column: str,
         qr_size: Size of the QR code modules
         qr_border: Border width in modules
         output_size: Final output image size in pixels (optional)
+        max_workers: Number of worker processes for rendering (defaults to the CPU count, 1 disables multiprocessing)
+        progress_callback: Optional callable receiving (completed, total) as QR codes are rendered
+        use_cache: Reuse PNGs previously rendered for the same URL and settings
+        fast_mask: Skip the best mask pattern search when encoding (about 2x faster)
+        optimize_png: Losslessly shrink each PNG with oxipng; slower, and ignored if oxipng isn't installed
         
-    Returns:
-        List[Tuple[str, bytes]]: List of (filename, image_bytes) tuples
+    Yields:
+        Tuple[str, bytes]: (filename, image_bytes) for each generated QR code
     """
-    qr_codes = []
-    
     # Log initial dataframe info
     log_dataframe_info(df, "Original dataframe before filtering")
     logger.info(f"Generating QR codes with parameters: qr_size={qr_size}, qr_border={qr_border}, output_size={output_size}")
@@ -69,39 +259,49 @@ def generate_qr_codes(df: pd.DataFrame, url_column: str,
     # Check data types and log URL column data type
     logger.info(f"URL column '{url_column}' data type: {df[url_column].dtype}")
     
+    # Per-row diagnostics are only built when INFO logging is on (debug mode)
+    info_enabled = logger.isEnabledFor(logging.INFO)
+    
+    if optimize_png and not OXIPNG_AVAILABLE:
+        logger.warning("PNG optimization requested but oxipng is not installed (pip install pyoxipng); skipping it")
+        optimize_png = False
+    
     # Log detailed information about URL column to debug Excel formula issues
-    logger.info("Examining URL column data to check for Excel formulas or dynamic content:")
-    for idx, value in df[url_column].head(10).items():
-        url_str = str(value)
-        starts_with_http = url_str.lower().startswith('http')
-        url_length = len(url_str)
-        logger.info(f"Row {idx} URL: type={type(value).__name__}, length={url_length}, starts_with_http={starts_with_http}")
-        logger.info(f"  Value: {url_str[:100]}{'...' if url_length > 100 else ''}")
+    if info_enabled:
+        logger.info("Examining URL column data to check for Excel formulas or dynamic content:")
+        for idx, value in df[url_column].head(10).items():
+            url_str = str(value)
+            starts_with_http = url_str.lower().startswith('http')
+            url_length = len(url_str)
+            logger.info(f"Row {idx} URL: type={type(value).__name__}, length={url_length}, starts_with_http={starts_with_http}")
+            logger.info(f"  Value: {url_str[:100]}{'...' if url_length > 100 else ''}")
         
-    # Filter out rows with empty or NaN URLs to be extra safe
-    valid_df = df.dropna(subset=[url_column]).copy()
-    logger.info(f"After dropping NaN values in {url_column}: {len(valid_df)} rows remaining")
-    
-    # Filter out empty strings
-    valid_df = valid_df[valid_df[url_column].astype(str).str.strip() != '']
+    # Filter out rows with empty or NaN URLs to be extra safe, applying one combined mask.
+    # The URL column is converted to strings once and every URL check reuses it.
+    url_strings = df[url_column].astype(str)
+    url_notna = df[url_column].notna()
+    url_not_empty = url_strings.str.strip() != ''
+    logger.info(f"After dropping NaN values in {url_column}: {int(url_notna.sum())} rows remaining")
+    valid_rows = url_notna & url_not_empty
+    valid_df = df.loc[valid_rows]
+    valid_urls = url_strings[valid_rows]
     logger.info(f"After filtering empty strings in {url_column}: {len(valid_df)} rows remaining")
     
     # Check for URLs that don't start with http/https - might be Excel formulas not evaluating correctly
-    non_http_urls = valid_df[~valid_df[url_column].astype(str).str.lower().str.startswith(('http://', 'https://'))]
+    non_http_urls = valid_urls[~valid_urls.str.lower().str.startswith(('http://', 'https://'))]
     if not non_http_urls.empty:
         logger.warning(f"Found {len(non_http_urls)} URLs that don't start with http:// or https://")
-        for idx, row in non_http_urls.head(5).iterrows():
-            logger.warning(f"Row {idx} has non-HTTP URL: {str(row[url_column])}")
+        for idx, url_value in non_http_urls.head(5).items():
+            logger.warning(f"Row {idx} has non-HTTP URL: {url_value}")
     
     # Check for problematic filename patterns that would be filtered later
-    problematic_patterns = ['missing_missing', 'nan_nan', 'item_item', 'empty_empty']
-    for pattern in problematic_patterns:
-        matches = valid_df[valid_df[filename_column].astype(str).str.contains(pattern, case=False)]
+    lowered_filenames = valid_df[filename_column].astype(str).str.lower()
+    for pattern in PROBLEMATIC_FILENAME_PATTERNS:
+        matches = valid_df[lowered_filenames.str.contains(pattern, regex=False)]
         if not matches.empty:
             logger.warning(f"Found {len(matches)} rows with problematic filename pattern '{pattern}'")
             # For each matching row, log the raw URL value to help diagnose the issue
-            for idx, row in matches.head(5).iterrows():
-                url_value = row[url_column]
+            for idx, url_value in matches[url_column].head(5).items():
                 logger.warning(f"Row {idx} with '{pattern}' in filename has URL: {url_value} (type: {type(url_value).__name__})")
     
     # Log filename info
@@ -117,112 +317,192 @@ def generate_qr_codes(df: pd.DataFrame, url_column: str,
         if not duplicates.empty:
             logger.warning(f"Found duplicate filenames: {duplicates.to_dict()}")
     
-    # Generate QR codes
-    generated_filenames = []
-    row_count = len(valid_df)
+    # Drop rows with problematic filenames in one vectorized pass; empty and NaN URLs are
+    # already filtered out and non-HTTP URLs are reported above, so the rest are all rendered
+    skip_filenames = lowered_filenames.str.contains(_PROBLEMATIC_FILENAME_RE.pattern, regex=True)
+    for index, filename in valid_df.loc[skip_filenames, filename_column].items():
+        logger.warning(f"Row {index}: Skipping file with problematic filename pattern: {filename}")
+    render_df = valid_df[~skip_filenames]
     
-    for i, (index, row) in enumerate(valid_df.iterrows()):
-        try:
-            url = str(row[url_column])
-            filename = str(row[filename_column])
-            
-            # Log the row data we're processing
+    # Collect the (url, filename) pairs to render from plain NumPy arrays
+    urls = valid_urls[~skip_filenames].to_numpy()
+    filenames = render_df[filename_column].astype(str).to_numpy()
+    tasks = list(zip(urls, filenames))
+    
+    # Log the rows we're processing
+    if info_enabled:
+        row_count = len(render_df)
+        for i, index in enumerate(render_df.index):
             if i < 5 or i == row_count - 1:  # Log first 5 and last row
-                log_row_data(row, index, f"Processing row {i+1}/{row_count}")
+                log_row_data(render_df.iloc[i], index, f"Processing row {i+1}/{row_count}")
             elif i % 20 == 0:  # Log every 20th row
                 logger.info(f"Processing row {i+1}/{row_count}")
-            
-            # Skip problematic filenames
-            if any(pattern in filename.lower() for pattern in problematic_patterns):
-                logger.warning(f"Row {index}: Skipping file with problematic filename pattern: {filename}")
-                continue
-            
-            # Skip if filename contains 'nan' (could happen with str conversion of NaN)
-            if 'nan' in filename.lower():
-                logger.warning(f"Row {index}: Skipping file with NaN in filename: {filename}")
-                continue
+    
+    # Reuse cached PNGs where possible and render each distinct uncached URL only once
+    total_tasks = len(tasks)
+    cached_pngs: List[Optional[bytes]] = [None] * total_tasks
+    render_tasks = []
+    remaining_uses = Counter()  # Uncached rows still to be emitted, per URL
+    for pos, (url, filename) in enumerate(tasks):
+        cached_png = _get_cached_qr_png((url, qr_size, qr_border, output_size, fast_mask, optimize_png)) if use_cache else None
+        if cached_png is not None:
+            cached_pngs[pos] = cached_png
+            continue
+        if url not in remaining_uses:
+            render_tasks.append((url, filename))
+        remaining_uses[url] += 1
+    
+    cache_hits = total_tasks - sum(remaining_uses.values())
+    if use_cache:
+        logger.info(f"QR code cache: {cache_hits} hits, {len(render_tasks)} to render")
+    if len(render_tasks) < total_tasks - cache_hits:
+        logger.info(f"Reusing QR codes for {total_tasks - cache_hits - len(render_tasks)} rows with repeated URLs")
+    if progress_callback is not None and cache_hits:
+        progress_callback(cache_hits, total_tasks)
+    
+    # Generate QR codes, fanning out to worker processes for larger batches
+    workers = max_workers or os.cpu_count() or 1
+    render = partial(_render_qr_png, size=qr_size, border=qr_border, output_size=output_size,
+                     fast_mask=fast_mask, optimize_png=optimize_png)
+    
+    executor = None
+    if workers > 1 and len(render_tasks) >= PARALLEL_MIN_ROWS:
+        logger.info(f"Rendering {len(render_tasks)} QR codes using {workers} worker processes")
+        executor = ProcessPoolExecutor(max_workers=workers)
+        # About four chunks per worker keeps IPC overhead low while still balancing the load
+        chunksize = max(1, len(render_tasks) // (4 * workers))
+        results = executor.map(render, render_tasks, chunksize=chunksize)
+    else:
+        results = map(render, render_tasks)
+    
+    generated_filenames = []
+    rendered_count = 0
+    completed = cache_hits
+    shared_pngs: Dict[str, Optional[bytes]] = {}  # PNGs of repeated URLs, kept until their last row
+    reported_percent = cache_hits * 100 // total_tasks if total_tasks else 0
+    try:
+        for pos, (url, filename) in enumerate(tasks):
+            img_bytes = cached_pngs[pos]
+            if img_bytes is None:
+                if url in shared_pngs:
+                    img_bytes = shared_pngs[url]
+                else:
+                    # Rendered results arrive in the same order as render_tasks
+                    _, img_bytes = next(results)
+                    rendered_count += 1
+                    if use_cache and img_bytes is not None:
+                        _store_cached_qr_png((url, qr_size, qr_border, output_size, fast_mask, optimize_png), img_bytes)
                 
-            # Skip if URL is just whitespace
-            if url.strip() == '':
-                logger.warning(f"Row {index}: Empty URL after stripping whitespace")
-                continue
-            
-            # Skip if URL doesn't start with http:// or https:// 
-            # This is optional - comment this out if you have valid URLs that don't start with http
-            if not url.lower().startswith(('http://', 'https://')):
-                logger.warning(f"Row {index}: URL doesn't start with http:// or https://: {url}")
-                # We're not skipping these URLs as they may be valid formula results in Excel
-                # If you want to skip them, uncomment the next line
-                # continue
+                # Hold on to the PNG only while later rows still need it
+                remaining_uses[url] -= 1
+                if remaining_uses[url]:
+                    shared_pngs[url] = img_bytes
+                else:
+                    shared_pngs.pop(url, None)
                 
-            # Generate QR code
-            logger.info(f"Generating QR code for URL: {url[:50]}..." if len(url) > 50 else f"Generating QR code for URL: {url}")
-            img = create_qr_code(url, size=qr_size, border=qr_border, output_size=output_size)
+                # Only report whole-percent steps so the UI isn't updated for every QR code
+                completed += 1
+                if progress_callback is not None and completed * 100 // total_tasks > reported_percent:
+                    reported_percent = completed * 100 // total_tasks
+                    progress_callback(completed, total_tasks)
             
-            # Convert to bytes
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_bytes = img_byte_arr.getvalue()
-            
-            # Keep track of generated filenames
-            generated_filenames.append(filename)
-            qr_codes.append((filename, img_bytes))
-            logger.info(f"Successfully generated QR code: {filename}")
-            
-        except Exception as e:
-            # Log the error with more details
-            logger.error(f"Error processing row {index}:", exc_info=True)
-            logger.error(f"Row data: URL={row.get(url_column, 'N/A')}, filename={row.get(filename_column, 'N/A')}")
-            continue
+            if img_bytes is not None:
+                # Keep track of generated filenames
+                generated_filenames.append(filename)
+                if info_enabled:
+                    logger.info(f"Successfully generated QR code: {filename}")
+                yield filename, img_bytes
+    finally:
+        if executor is not None:
+            # Drop any queued chunks rather than waiting for them when the generator is
+            # abandoned early (e.g. a Streamlit rerun or an error while writing the ZIP)
+            executor.shutdown(wait=False, cancel_futures=True)
     
     # Log summary information
     log_qr_generation_summary(
         total_rows=len(df),
         valid_rows=len(valid_df),
-        qr_codes_generated=len(qr_codes),
+        qr_codes_generated=len(generated_filenames),
         output_filenames=generated_filenames
     )
+
+
+def generate_qr_codes(df: pd.DataFrame, url_column: str, 
+                      filename_column: str = 'generated_filename',
+                      qr_size: int = 10, qr_border: int = 4,
+                      output_size: Optional[int] = None,
+                      max_workers: Optional[int] = None,
+                      progress_callback: Optional[Callable[[int, int], None]] = None,
+                      use_cache: bool = True,
+                      fast_mask: bool = False,
+                      optimize_png: bool = False) -> List[Tuple[str, bytes]]:
+    """
+    Generate QR codes for all URLs in the dataframe.
     
-    return qr_codes
+    Collects the output of iter_qr_codes into a list; see that function for the arguments.
+        
+    Returns:
+        List[Tuple[str, bytes]]: List of (filename, image_bytes) tuples
+    """
+    return list(iter_qr_codes(
+        df, url_column, filename_column,
+        qr_size=qr_size, qr_border=qr_border, output_size=output_size,
+        max_workers=max_workers, progress_callback=progress_callback,
+        use_cache=use_cache, fast_mask=fast_mask, optimize_png=optimize_png
+    ))
 
 
-def create_zip_file(qr_codes: List[Tuple[str, bytes]]) -> bytes:
+def create_zip_file(qr_codes: Iterable[Tuple[str, bytes]], preview_count: int = 0,
+                    compression: int = zipfile.ZIP_STORED,
+                    output: Optional[BinaryIO] = None) -> Dict[str, Any]:
     """
     Create a ZIP file containing all generated QR codes.
     Handles potential duplicate filenames by adding a unique index.
     
+    QR codes are written to the archive as they are consumed, so qr_codes can be a
+    generator such as iter_qr_codes() without holding every PNG in memory at once.
+    
     Args:
-        qr_codes: List of (filename, image_bytes) tuples
+        qr_codes: Iterable of (filename, image_bytes) tuples
+        preview_count: Number of leading archived QR codes to keep for previews
+        compression: zipfile compression mode; PNGs are already deflate-compressed,
+                     so ZIP_STORED avoids a second compression pass for no size gain
+        output: Writable binary file to stream the archive into (e.g. a temporary file
+                on disk); by default the archive is built in memory
         
     Returns:
-        bytes: ZIP file as bytes
+        Dict: 'data' (ZIP file as bytes, or None when written to output),
+              'qr_count' (number of QR codes received),
+              'file_count' (number of files written to the ZIP), 'first_filenames'
+              (names of the first five files in the ZIP) and 'previews'
+              (the first preview_count (filename, image_bytes) tuples written to the ZIP)
     """
-    zip_buffer = io.BytesIO()
+    zip_buffer = output if output is not None else io.BytesIO()
+    info_enabled = logger.isEnabledFor(logging.INFO)
     
     # Track filenames to handle duplicates
     seen_filenames = {}
     skipped_files = 0
+    problematic_count = 0
+    qr_count = 0
+    file_count = 0
+    first_filenames = []
+    previews = []
     
-    # Check for problematic filenames
-    problematic_patterns = ['missing_missing', 'nan_nan', 'item_item', 'empty_empty']
-    problematic_count = sum(1 for filename, _ in qr_codes if any(pattern in filename.lower() for pattern in problematic_patterns))
-    if problematic_count > 0:
-        logger.warning(f"Found {problematic_count} filenames with problematic patterns (e.g., missing_missing)")
+    # Every entry shares one timestamp, so writestr doesn't have to look up the time per file
+    archive_time = time.localtime()[:6]
     
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+    with zipfile.ZipFile(zip_buffer, 'w', compression, allowZip64=True) as zip_file:
         for filename, img_bytes in qr_codes:
-            # Skip problematic filenames
-            if any(pattern in filename.lower() for pattern in problematic_patterns):
+            qr_count += 1
+            
+            # Skip problematic filenames, matching all patterns in one case-insensitive scan
+            if _PROBLEMATIC_FILENAME_RE.search(filename):
                 skipped_files += 1
+                problematic_count += 1
                 logger.warning(f"Skipping file with problematic filename pattern: {filename}")
                 continue
             
-            # Skip any filenames containing 'nan'
-            if 'nan' in filename.lower():
-                skipped_files += 1
-                logger.warning(f"Skipping file with 'nan' in filename: {filename}")
-                continue
-                
             # Handle duplicate filenames
             if filename in seen_filenames:
                 seen_filenames[filename] += 1
@@ -235,21 +515,60 @@ def create_zip_file(qr_codes: List[Tuple[str, bytes]]) -> bytes:
             
             # Add to zip file
             try:
-                zip_file.writestr(filename, img_bytes)
-                logger.info(f"Added file to ZIP: {filename}")
+                zip_info = zipfile.ZipInfo(filename, date_time=archive_time)
+                zip_info.compress_type = compression
+                zip_info.external_attr = 0o600 << 16  # Same permissions writestr gives a plain filename
+                zip_file.writestr(zip_info, img_bytes)
+                file_count += 1
+                # Previews carry the name the file was archived under, after any renaming
+                if len(previews) < preview_count:
+                    previews.append((filename, img_bytes))
+                if len(first_filenames) < 5:
+                    first_filenames.append(filename)
+                if info_enabled:
+                    logger.info(f"Added file to ZIP: {filename}")
             except Exception as e:
                 logger.error(f"Error adding {filename} to ZIP: {str(e)}")
                 skipped_files += 1
     
     # Log summary
-    logger.info(f"ZIP file created with {len(seen_filenames)} QR codes")
-    if skipped_files > 0 or len(seen_filenames) != len(qr_codes):
-        total_skipped = len(qr_codes) - len(seen_filenames)
+    if problematic_count > 0:
+        logger.warning(f"Found {problematic_count} filenames with problematic patterns (e.g., missing_missing)")
+    logger.info(f"ZIP file created with {file_count} QR codes")
+    if first_filenames:
+        logger.info(f"First 5 files in ZIP: {first_filenames}")
+    if skipped_files > 0 or len(seen_filenames) != qr_count:
+        total_skipped = qr_count - len(seen_filenames)
         logger.warning(f"Note: {total_skipped} files were skipped or renamed due to duplicates or invalid names")
         logger.warning(f"Skipped files (problematic patterns): {skipped_files}")
     
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+    return {
+        'data': zip_buffer.getvalue() if output is None else None,
+        'qr_count': qr_count,
+        'file_count': file_count,
+        'first_filenames': first_filenames,
+        'previews': previews,
+    }
+
+
+def create_thumbnail(img_bytes: bytes, max_size: int = 150) -> bytes:
+    """
+    Create a small PNG preview of a QR code image.
+    
+    Args:
+        img_bytes: Full-size PNG image data
+        max_size: Maximum width and height of the thumbnail in pixels
+        
+    Returns:
+        bytes: Thumbnail PNG data (the original bytes if the image is already small enough)
+    """
+    img = Image.open(io.BytesIO(img_bytes))
+    if img.width <= max_size and img.height <= max_size:
+        return img_bytes
+    
+    thumb_byte_arr = io.BytesIO()
+    img.resize((max_size, max_size), Image.NEAREST).save(thumb_byte_arr, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+    return thumb_byte_arr.getvalue()
 
 
 def get_image_download_link(img_bytes: bytes, filename: str) -> str:
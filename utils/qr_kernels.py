@@ -0,0 +1,217 @@
+import numpy as np
+import qrcode
+from bisect import bisect_left
+from functools import lru_cache
+from qrcode import util
+from qrcode.exceptions import DataOverflowError
+
+# 1:1:3:1:1 finder-like patterns with a 4-module light area on either side
+_FINDER_PATTERN_1 = (1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0)
+_FINDER_PATTERN_2 = (0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1)
+
+# The eight QR mask conditions (see qrcode.util.mask_func), evaluated on index grids
+_MASK_FUNCTIONS = (
+    lambda i, j: (i + j) % 2 == 0,
+    lambda i, j: i % 2 == 0,
+    lambda i, j: j % 3 == 0,
+    lambda i, j: (i + j) % 3 == 0,
+    lambda i, j: (i // 2 + j // 3) % 2 == 0,
+    lambda i, j: (i * j) % 2 + (i * j) % 3 == 0,
+    lambda i, j: ((i * j) % 2 + (i * j) % 3) % 2 == 0,
+    lambda i, j: ((i * j) % 3 + (i + j) % 2) % 2 == 0,
+)
+
+# Version ranges that share character-count field widths (see qrcode.util.mode_sizes_for_version)
+_VERSION_BRACKETS = ((1, 9), (10, 26), (27, 40))
+
+
+def _run_length_penalty(lines: np.ndarray) -> np.ndarray:
+    """
+    Penalty for runs of five or more same-colored modules along each line.
+    
+    Args:
+        lines: Boolean array of shape (batch, lines, modules)
+    
+    Returns:
+        np.ndarray: Sum of (run_length - 2) for every run of length 5 or more, per batch entry
+    """
+    batch, line_count, line_length = lines.shape
+    # End each line with a sentinel so runs never continue across lines
+    padded = np.empty((batch, line_count, line_length + 1), dtype=np.int8)
+    padded[..., :-1] = lines
+    padded[..., -1] = -1
+    flat = padded.ravel()
+    run_ends = np.flatnonzero(flat[1:] != flat[:-1])
+    run_lengths = np.diff(run_ends, prepend=-1)
+    long_runs = run_lengths >= 5
+    owners = run_ends[long_runs] // (line_count * (line_length + 1))
+    return np.bincount(owners, weights=run_lengths[long_runs] - 2, minlength=batch).astype(np.int64)
+
+
+def _finder_pattern_penalty(lines: np.ndarray) -> np.ndarray:
+    """
+    Penalty for finder-like patterns along each line.
+    
+    Args:
+        lines: Boolean array of shape (batch, lines, modules)
+    
+    Returns:
+        np.ndarray: 40 points for every occurrence of either pattern, per batch entry
+    """
+    width = lines.shape[2] - len(_FINDER_PATTERN_1) + 1
+    inverted = ~lines
+    matches_1 = np.ones(lines.shape[:2] + (width,), dtype=bool)
+    matches_2 = matches_1.copy()
+    # AND together one shifted slice per pattern position
+    for offset, (dark_1, dark_2) in enumerate(zip(_FINDER_PATTERN_1, _FINDER_PATTERN_2)):
+        matches_1 &= (lines if dark_1 else inverted)[..., offset:offset + width]
+        matches_2 &= (lines if dark_2 else inverted)[..., offset:offset + width]
+    return (matches_1 | matches_2).sum(axis=(1, 2)) * 40
+
+
+def lost_points(matrices: np.ndarray) -> np.ndarray:
+    """
+    Compute QR mask penalty scores for a stack of module matrices.
+    
+    A vectorized equivalent of qrcode.util.lost_point: the same four
+    penalty rules, evaluated for the whole stack with NumPy array
+    operations instead of per-module Python loops.
+    
+    Args:
+        matrices: Boolean array of shape (batch, n, n), True for dark modules
+    
+    Returns:
+        np.ndarray: Penalty score per matrix, lower is better
+    """
+    modules_count = matrices.shape[1]
+    # Rows followed by columns, so the line-based rules run once over both directions
+    lines = np.concatenate([matrices, matrices.transpose(0, 2, 1)], axis=1)
+    
+    # Rule 1: long runs of the same color in rows and columns
+    scores = _run_length_penalty(lines)
+    
+    # Rule 2: 2x2 blocks of the same color
+    top_left = matrices[:, :-1, :-1]
+    blocks = (top_left == matrices[:, :-1, 1:]) & (top_left == matrices[:, 1:, :-1]) & (top_left == matrices[:, 1:, 1:])
+    scores += blocks.sum(axis=(1, 2)) * 3
+    
+    # Rule 3: finder-like patterns in rows and columns
+    scores += _finder_pattern_penalty(lines)
+    
+    # Rule 4: every 5% departure from a 50% dark ratio
+    percent = matrices.sum(axis=(1, 2)) / (modules_count ** 2)
+    scores += (np.abs(percent * 100 - 50) / 5).astype(np.int64) * 10
+    
+    return scores
+
+
+def lost_point(matrix: np.ndarray) -> int:
+    """
+    Compute the QR mask penalty score for a single module matrix.
+    
+    Args:
+        matrix: Square boolean module matrix (True for dark modules)
+    
+    Returns:
+        int: Penalty score, lower is better
+    """
+    return int(lost_points(matrix[np.newaxis])[0])
+
+
+def _segment_bits(data: util.QRData) -> int:
+    """
+    Number of bits a data segment's payload takes, excluding its mode and length headers.
+    
+    Args:
+        data: Segment from QRCode.data_list
+    
+    Returns:
+        int: Payload bit count for the segment's encoding mode
+    """
+    length = len(data)
+    if data.mode == util.MODE_NUMBER:
+        return 10 * (length // 3) + (0, 4, 7)[length % 3]
+    if data.mode == util.MODE_ALPHA_NUM:
+        return 11 * (length // 2) + 6 * (length % 2)
+    return 8 * length
+
+
+def best_fit_version(qr: qrcode.QRCode) -> int:
+    """
+    Find and set the smallest QR version that holds the data.
+    
+    Replacement for QRCode.best_fit. qrcode writes every segment into a
+    BitBuffer one bit at a time just to measure it; here the bit count is
+    computed arithmetically for each range of versions that share header
+    sizes, then looked up in the same capacity table, so the chosen
+    version is identical.
+    
+    Args:
+        qr: QRCode object with data added
+    
+    Returns:
+        int: Chosen version (1-40), also stored on qr.version
+    
+    Raises:
+        DataOverflowError: If the data doesn't fit in a version 40 symbol
+    """
+    limits = util.BIT_LIMIT_TABLE[qr.error_correction]
+    segments = [(data.mode, _segment_bits(data)) for data in qr.data_list]
+    for first, last in _VERSION_BRACKETS:
+        mode_sizes = util.mode_sizes_for_version(first)
+        needed_bits = sum(4 + mode_sizes[mode] + bits for mode, bits in segments)
+        version = bisect_left(limits, needed_bits, first, last + 1)
+        if version <= last:
+            qr.version = version
+            return version
+    raise DataOverflowError()
+
+
+@lru_cache(maxsize=None)
+def _mask_layout(version: int) -> np.ndarray:
+    """
+    Build the eight mask patterns for a QR version, limited to its data modules.
+    
+    The data modules are the ones qrcode leaves empty for map_data once the
+    function patterns and (test-mode) format/version information are placed.
+    
+    Args:
+        version: QR code version (1-40)
+    
+    Returns:
+        np.ndarray: Boolean array of shape (8, n, n), True where each mask flips a data module
+    """
+    layout = qrcode.QRCode(version=version)
+    layout.data_cache = []
+    # Shadow map_data so makeImpl stops right before placing the data modules
+    layout.map_data = lambda data, mask_pattern: None
+    layout.makeImpl(True, 0)
+    data_region = np.array([[cell is None for cell in row] for row in layout.modules])
+    
+    rows, cols = np.indices(data_region.shape)
+    return np.stack([mask(rows, cols) & data_region for mask in _MASK_FUNCTIONS])
+
+
+def best_mask_pattern(qr: qrcode.QRCode) -> int:
+    """
+    Find the mask pattern with the lowest penalty score.
+    
+    Replacement for QRCode.best_mask_pattern. Instead of running makeImpl
+    once per pattern, the symbol is built once and the other seven
+    candidates are derived by re-masking its data modules, then all eight
+    are scored in one batched lost_points call. In test mode the format
+    and version information is blank for every pattern, so the candidates
+    match what makeImpl(True, pattern) would produce. The QR code's
+    version must already be set (e.g. via best_fit_version).
+    
+    Args:
+        qr: QRCode object with data added and version chosen
+    
+    Returns:
+        int: Mask pattern (0-7), ties resolved to the lowest pattern like qrcode does
+    """
+    qr.makeImpl(True, 0)
+    masks = _mask_layout(qr.version)
+    unmasked = np.asarray(qr.modules, dtype=bool) ^ masks[0]
+    candidates = unmasked[np.newaxis] ^ masks
+    return int(np.argmin(lost_points(candidates)))